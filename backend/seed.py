@@ -0,0 +1,11 @@
+"""Seed the database with demo users, games and a welcome notice.
+
+Run once after creating a fresh database:
+
+    python -m backend.seed
+"""
+from backend.main import init_demo_data
+
+if __name__ == "__main__":
+    init_demo_data()
+    print("Demo data seeded.")